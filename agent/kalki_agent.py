@@ -3,12 +3,27 @@
 
 import os
 import asyncio
-import aiohttp
-from web3 import Web3
+import httpx
+import numpy as np
+try:
+    from numba import njit
+except ImportError:
+    # numba is optional - without it _score simply runs as plain Python
+    def njit(*args, **kwargs):
+        return lambda func: func
+from web3 import AsyncWeb3, WebsocketProviderV2
+from web3.exceptions import TransactionNotFound
 from eth_account import Account
-import json
-from typing import Dict, List, Optional
+from Crypto.Hash import keccak
+from eth_abi import encode
+from hexbytes import HexBytes
+import orjson
+import time
+from typing import Dict, List, Optional, Set, Tuple
+from collections import OrderedDict
+from functools import lru_cache
 import logging
+import re
 from datetime import datetime
 
 # Configure logging
@@ -18,6 +33,127 @@ logging.basicConfig(
 )
 logger = logging.getLogger("KalkiAgent")
 
+# Maximum number of resolution requests processed concurrently
+MAX_INFLIGHT = 8
+
+# Below this many sources, scoring runs as a plain Python loop; above it,
+# array setup is amortized and the NumPy/Numba path wins
+VECTORIZE_THRESHOLD = 32
+
+# Weight given to a source's answer when it does not report a confidence
+DEFAULT_SOURCE_CONFIDENCE = 50
+
+# Seconds a fetched gas price is reused before asking the node again
+GAS_PRICE_TTL = 10
+
+
+def _keccak256(data: bytes) -> HexBytes:
+    """keccak-256 via pycryptodome's C implementation"""
+    return HexBytes(keccak.new(digest_bits=256, data=data).digest())
+
+
+# AgentSelected(bytes32 indexed requestId, address indexed agent, uint256 selectionWeight):
+# topic0 is the event signature hash, followed by one topic per indexed parameter
+AGENT_SELECTED_TOPIC = _keccak256(b"AgentSelected(bytes32,address,uint256)")
+REQUEST_ID_TOPIC_INDEX = 1
+AGENT_TOPIC_INDEX = 2
+
+# submitResolution calldata is encoded directly, bypassing the contract function factory
+SUBMIT_RESOLUTION_SELECTOR = _keccak256(b"submitResolution(bytes32,bool,uint256,bytes32)")[:4]
+SUBMIT_RESOLUTION_TYPES = ['bytes32', 'bool', 'uint256', 'bytes32']
+
+# Request details are re-read from chain after this many seconds
+REQUEST_CACHE_TTL = 300
+REQUEST_CACHE_SIZE = 1024
+
+# Seconds of gathering time that share one evidence hash bucket
+EVIDENCE_HASH_WINDOW = 60
+
+# Short unescaped "content" string in a chat completion (our YES/NO answers)
+_SHORT_CONTENT_RE = re.compile(rb'"content"\s*:\s*"([^"\\]{1,32})"')
+
+
+def _to_int(value) -> int:
+    """Quantity fields arrive as ints from formatted RPCs and hex strings from raw ones"""
+    return int(value, 16) if isinstance(value, str) else int(value)
+
+
+def _source_weight(source: Dict) -> float:
+    """A source's vote weight; missing or null confidence gets the default, 0 stays 0"""
+    confidence = source.get('confidence')
+    return DEFAULT_SOURCE_CONFIDENCE if confidence is None else confidence
+
+
+def _encode_answer(answer: Optional[bool]) -> int:
+    """Map a source answer to 1 (YES), -1 (NO) or 0 (no answer)"""
+    if answer is True:
+        return 1
+    if answer is False:
+        return -1
+    return 0
+
+
+@njit(cache=True)
+def _score(answers: np.ndarray):
+    """
+    Count YES (1) and NO (-1) answers; 0 means the source gave no answer.
+    Returns (yes, no, total).
+    """
+    yes = 0
+    no = 0
+    for a in answers:
+        if a == 1:
+            yes += 1
+        elif a == -1:
+            no += 1
+    return yes, no, answers.shape[0]
+
+
+def _freeze(value):
+    """Recursively convert dicts/lists into tuples, with dict items sorted by key"""
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+@lru_cache(maxsize=256)
+def _evidence_hash(preimage: bytes) -> bytes:
+    """
+    keccak-256 of an evidence preimage. Cached on the exact serialized bytes,
+    so values that compare equal in Python but encode differently (1, 1.0,
+    true) never share an entry.
+    """
+    return keccak.new(digest_bits=256, data=preimage).digest()
+
+
+def _hash_evidence(evidence: Dict) -> bytes:
+    """
+    Hash committing to the question, category, each source's name, answer and
+    data, and timestamp // EVIDENCE_HASH_WINDOW - not to the evidence document
+    itself. The preimage is the compact JSON array
+        [question, category, [[source, answer, [[key, value], ...]], ...], ts_bucket]
+    where source data has been frozen into key-sorted [key, value] pairs, so it
+    holds no JSON objects; a verifier must rebuild exactly this form to
+    recompute evidenceHash. Identical evidence gathered within the same window
+    reuses the cached hash.
+    """
+    sources_key = tuple(
+        (s['source'], s.get('answer'), _freeze(s.get('data', {})))
+        for s in evidence['sources']
+    )
+    preimage = orjson.dumps(
+        [
+            evidence['question'],
+            evidence['category'],
+            sources_key,
+            evidence['timestamp'] // EVIDENCE_HASH_WINDOW
+        ],
+        option=orjson.OPT_SORT_KEYS
+    )
+    return _evidence_hash(preimage)
+
 
 class KalkiAgent:
     """
@@ -28,21 +164,59 @@ class KalkiAgent:
     4. Earns rewards or gets slashed based on accuracy
     """
     
-    def __init__(self, private_key: str, contract_address: str, rpc_url: str):
-        self.w3 = Web3(Web3.HTTPProvider(rpc_url))
+    def __init__(
+        self,
+        private_key: str,
+        contract_address: str,
+        rpc_url: str,
+        ws_rpc_url: Optional[str] = None
+    ):
+        self.w3 = AsyncWeb3(AsyncWeb3.AsyncHTTPProvider(rpc_url))
+        self.ws_rpc_url = ws_rpc_url
         self.account = Account.from_key(private_key)
         
         # Load contract ABI
         self.contract = self.w3.eth.contract(
-            address=Web3.to_checksum_address(contract_address),
+            address=AsyncWeb3.to_checksum_address(contract_address),
             abi=self.load_abi()
         )
         
+        # Contract functions resolved once instead of on every call
+        self._fn_get_resolution_request = self.contract.get_function_by_name('getResolutionRequest')
+        self._fn_get_agent_stats = self.contract.get_function_by_name('getAgentStats')
+        self._fn_register_agent = self.contract.get_function_by_name('registerAgent')
+        
         # API keys from environment
         self.openai_api_key = os.getenv('OPENAI_API_KEY')
         self.perplexity_api_key = os.getenv('PERPLEXITY_API_KEY')
         self.pinata_jwt = os.getenv('PINATA_JWT')
         
+        # Topics used to filter AgentSelected logs at the node: event
+        # signature plus our own address as the indexed `agent` parameter
+        self.agent_topic = '0x' + self.account.address[2:].lower().rjust(64, '0')
+        self.agent_address_bytes = bytes.fromhex(self.account.address[2:])
+        self.event_topics = [AGENT_SELECTED_TOPIC, None, self.agent_topic]
+        
+        # Resolution requests run as background tasks, bounded by MAX_INFLIGHT
+        self._inflight = asyncio.Semaphore(MAX_INFLIGHT)
+        self._tasks: Set[asyncio.Task] = set()
+        
+        # WebSocket listener position: last handled block and the logs handled in it
+        self._ws_block = 0
+        self._ws_block_logs: Set[tuple] = set()
+        
+        # Chain values cached to keep RPCs off the submission path
+        self._gas_price_cache = (0, 0.0)
+        self._chain_id: Optional[int] = None
+        self._nonce: Optional[int] = None
+        self._nonce_lock = asyncio.Lock()
+        
+        # request_id -> (fetched_at, details) for duplicate AgentSelected deliveries
+        self._req_cache: "OrderedDict[bytes, Tuple[float, Dict]]" = OrderedDict()
+        
+        # Shared HTTP client, created in start() once an event loop is running
+        self.http: Optional[httpx.AsyncClient] = None
+        
         # Data sources
         self.sources = {
             'crypto': [
@@ -100,6 +274,31 @@ class KalkiAgent:
                 "name": "AgentSelected",
                 "type": "event"
             },
+            {
+                "inputs": [{"internalType": "bytes32", "name": "requestId", "type": "bytes32"}],
+                "name": "getResolutionRequest",
+                "outputs": [
+                    {
+                        "components": [
+                            {"internalType": "bytes32", "name": "marketId", "type": "bytes32"},
+                            {"internalType": "string", "name": "question", "type": "string"},
+                            {"internalType": "string", "name": "category", "type": "string"},
+                            {"internalType": "uint256", "name": "requestTime", "type": "uint256"},
+                            {"internalType": "uint256", "name": "resolutionDeadline", "type": "uint256"},
+                            {"internalType": "address", "name": "requester", "type": "address"},
+                            {"internalType": "uint256", "name": "fee", "type": "uint256"},
+                            {"internalType": "enum KalkiCore.ResolutionStatus", "name": "status", "type": "uint8"},
+                            {"internalType": "bool", "name": "finalOutcome", "type": "bool"},
+                            {"internalType": "uint256", "name": "agentCount", "type": "uint256"}
+                        ],
+                        "internalType": "struct KalkiCore.ResolutionRequest",
+                        "name": "",
+                        "type": "tuple"
+                    }
+                ],
+                "stateMutability": "view",
+                "type": "function"
+            },
             {
                 "inputs": [],
                 "name": "registerAgent",
@@ -116,26 +315,114 @@ class KalkiAgent:
         logger.info("=" * 60)
         logger.info("🚀 Kalki Agent started")
         
-        # Get agent stats
-        stats = await self.get_agent_stats()
-        logger.info(f"💰 Stake: {self.w3.from_wei(stats['stake'], 'ether')} BNB")
-        logger.info(f"⭐ Reputation: {stats['reputation']}/1000")
-        logger.info(f"📊 Total Resolutions: {stats['totalResolutions']}")
-        logger.info(f"🎯 Accuracy: {stats['accuracy']}%")
-        logger.info("=" * 60)
+        # One HTTP/2 client for all data sources so requests to the same host
+        # multiplex over a single connection
+        self.http = httpx.AsyncClient(
+            http2=True,
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=50),
+            timeout=10.0
+        )
+        
+        try:
+            # Get agent stats
+            stats = await self.get_agent_stats()
+            logger.info(f"💰 Stake: {self.w3.from_wei(stats['stake'], 'ether')} BNB")
+            logger.info(f"⭐ Reputation: {stats['reputation']}/1000")
+            logger.info(f"📊 Total Resolutions: {stats['totalResolutions']}")
+            logger.info(f"🎯 Accuracy: {stats['accuracy']}%")
+            logger.info("=" * 60)
+            
+            logger.info("👂 Listening for resolution requests...\n")
+            
+            if self.ws_rpc_url:
+                await self.subscribe_events()
+            else:
+                await self.poll_events()
+        finally:
+            # Stop in-flight requests before closing the client they use
+            for task in self._tasks:
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+            await self.http.aclose()
+    
+    async def subscribe_events(self):
+        """
+        Receive AgentSelected logs pushed by the node over a WebSocket subscription
+        """
+        # Logs are handled from the current head onwards; after a reconnect,
+        # everything since the last handled block is backfilled over HTTP
+        self._ws_block = await self.w3.eth.block_number
+        self._ws_block_logs = set()
+        
+        while True:
+            try:
+                async with AsyncWeb3.persistent_websocket(
+                    WebsocketProviderV2(self.ws_rpc_url)
+                ) as ws_w3:
+                    await ws_w3.eth.subscribe("logs", {
+                        'address': self.contract.address,
+                        'topics': self.event_topics
+                    })
+                    
+                    # The subscription is already live, so the backfill range
+                    # overlaps it instead of leaving a gap; duplicates are skipped
+                    backfill = await self.w3.eth.get_logs({
+                        'fromBlock': self._ws_block,
+                        'toBlock': 'latest',
+                        'address': self.contract.address,
+                        'topics': self.event_topics
+                    })
+                    for log in backfill:
+                        await self._process_subscribed_log(log)
+                    
+                    async for response in ws_w3.ws.listen_to_websocket():
+                        await self._process_subscribed_log(response['result'])
+                        
+            except Exception as e:
+                logger.error(f"❌ Error in subscription: {e}")
+                await asyncio.sleep(10)
+    
+    async def _process_subscribed_log(self, log: Dict):
+        """
+        Handle a subscription or backfill log exactly once, tracking the last
+        handled block so a reconnect knows where to backfill from
+        """
+        block = _to_int(log['blockNumber'])
+        key = (bytes(HexBytes(log['transactionHash'])), _to_int(log['logIndex']))
         
-        # Create event filter for AgentSelected events
-        event_filter = self.contract.events.AgentSelected.create_filter(fromBlock='latest')
+        if block < self._ws_block:
+            return
+        if block > self._ws_block:
+            self._ws_block = block
+            self._ws_block_logs = set()
+        elif key in self._ws_block_logs:
+            return
         
-        logger.info("👂 Listening for resolution requests...\n")
+        self._ws_block_logs.add(key)
+        await self.process_event_log(log)
+    
+    async def poll_events(self):
+        """
+        Fallback for HTTP-only RPCs - poll eth_getLogs every few seconds
+        """
+        # Start scanning for AgentSelected logs from the current head
+        last_block = await self.w3.eth.block_number
         
         while True:
             try:
                 # Check for new events
-                for event in event_filter.get_new_entries():
-                    if event['args']['agent'].lower() == self.account.address.lower():
-                        request_id = event['args']['requestId']
-                        await self.handle_resolution_request(request_id)
+                latest_block = await self.w3.eth.block_number
+                if latest_block >= last_block:
+                    logs = await self.w3.eth.get_logs({
+                        'fromBlock': last_block,
+                        'toBlock': latest_block,
+                        'address': self.contract.address,
+                        'topics': self.event_topics
+                    })
+                    last_block = latest_block + 1
+                    
+                    for log in logs:
+                        await self.process_event_log(log)
                 
                 await asyncio.sleep(5)  # Check every 5 seconds
                 
@@ -143,63 +430,95 @@ class KalkiAgent:
                 logger.error(f"❌ Error in main loop: {e}")
                 await asyncio.sleep(10)
     
-    async def handle_resolution_request(self, request_id: bytes):
+    async def process_event_log(self, log: Dict):
         """
-        Process a resolution request
+        Handle a raw AgentSelected log if it is addressed to this agent
         """
-        logger.info("\n" + "=" * 60)
-        logger.info(f"📨 New resolution request: 0x{request_id.hex()[:16]}...")
+        # Work on the raw topics instead of ABI-decoding the event. The node
+        # normally filters on our agent topic already, but not every RPC
+        # honours positional topic filters, so check the address locally too.
+        topics = log['topics']
+        if bytes(HexBytes(topics[AGENT_TOPIC_INDEX]))[-20:] != self.agent_address_bytes:
+            return
+        
+        request_id = bytes(HexBytes(topics[REQUEST_ID_TOPIC_INDEX]))
         
+        task = asyncio.create_task(self._safe_handle(request_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+    
+    async def _safe_handle(self, request_id: bytes):
+        """
+        Run a request handler as a background task without letting it crash the listener
+        """
         try:
-            # Get request details
-            request = await self.get_request_details(request_id)
-            
-            logger.info(f"❓ Question: {request['question']}")
-            logger.info(f"📁 Category: {request['category']}")
-            logger.info(f"⏰ Deadline: {datetime.fromtimestamp(request['deadline'])}")
-            
-            # Gather evidence
-            logger.info("🔍 Gathering evidence from multiple sources...")
-            evidence = await self.gather_evidence(
-                question=request['question'],
-                category=request['category']
-            )
-            
-            logger.info(f"✅ Collected evidence from {evidence['source_count']} sources")
-            
-            # Analyze with AI
-            logger.info("🧠 Analyzing with AI...")
-            analysis = await self.analyze_with_ai(
-                question=request['question'],
-                evidence=evidence
-            )
-            
-            logger.info(f"📊 Result: {'YES ✅' if analysis['outcome'] else 'NO ❌'}")
-            logger.info(f"📈 Confidence: {analysis['confidence']}%")
-            logger.info(f"💭 Reasoning: {analysis['reasoning'][:100]}...")
-            
-            # Submit to blockchain
-            logger.info("⛓️  Submitting to blockchain...")
-            tx_hash = await self.submit_resolution(
-                request_id=request_id,
-                outcome=analysis['outcome'],
-                confidence=analysis['confidence'],
-                evidence=evidence
-            )
-            
-            logger.info(f"✅ Submitted! TX: {tx_hash}")
-            logger.info("=" * 60 + "\n")
-            
+            await self.handle_resolution_request(request_id)
         except Exception as e:
-            logger.error(f"❌ Error handling request: {e}")
+            logger.error(f"❌ Unhandled error for request 0x{request_id.hex()[:16]}: {e}")
+    
+    async def handle_resolution_request(self, request_id: bytes):
+        """
+        Process a resolution request
+        """
+        async with self._inflight:
+            logger.info("\n" + "=" * 60)
+            logger.info(f"📨 New resolution request: 0x{request_id.hex()[:16]}...")
+            
+            try:
+                # Get request details
+                request = await self.get_request_details(request_id)
+                
+                logger.info(f"❓ Question: {request['question']}")
+                logger.info(f"📁 Category: {request['category']}")
+                logger.info(f"⏰ Deadline: {datetime.fromtimestamp(request['deadline'])}")
+                
+                # Gather evidence
+                logger.info("🔍 Gathering evidence from multiple sources...")
+                evidence = await self.gather_evidence(
+                    question=request['question'],
+                    category=request['category']
+                )
+                
+                logger.info(f"✅ Collected evidence from {evidence['source_count']} sources")
+                
+                # Analyze with AI
+                logger.info("🧠 Analyzing with AI...")
+                analysis = await self.analyze_with_ai(
+                    question=request['question'],
+                    evidence=evidence
+                )
+                
+                logger.info(f"📊 Result: {'YES ✅' if analysis['outcome'] else 'NO ❌'}")
+                logger.info(f"📈 Confidence: {analysis['confidence']}%")
+                logger.info(f"💭 Reasoning: {analysis['reasoning'][:100]}...")
+                
+                # Submit to blockchain
+                logger.info("⛓️  Submitting to blockchain...")
+                tx_hash = await self.submit_resolution(
+                    request_id=request_id,
+                    outcome=analysis['outcome'],
+                    confidence=analysis['confidence'],
+                    evidence=evidence
+                )
+                
+                logger.info(f"✅ Submitted! TX: {tx_hash}")
+                logger.info("=" * 60 + "\n")
+                
+            except Exception as e:
+                logger.error(f"❌ Error handling request: {e}")
     
     async def get_request_details(self, request_id: bytes) -> Dict:
         """
-        Get request details from smart contract
+        Get request details from smart contract, cached per request_id
         """
-        request = self.contract.functions.getResolutionRequest(request_id).call()
+        cached = self._req_cache.get(request_id)
+        if cached and time.monotonic() - cached[0] < REQUEST_CACHE_TTL:
+            self._req_cache.move_to_end(request_id)
+            return cached[1]
         
-        return {
+        request = await self._fn_get_resolution_request(request_id).call()
+        
+        details = {
             'marketId': request[0],
             'question': request[1],
             'category': request[2],
@@ -209,6 +528,13 @@ class KalkiAgent:
             'fee': request[6],
             'status': request[7]
         }
+        
+        self._req_cache[request_id] = (time.monotonic(), details)
+        self._req_cache.move_to_end(request_id)
+        if len(self._req_cache) > REQUEST_CACHE_SIZE:
+            self._req_cache.popitem(last=False)
+        
+        return details
     
     async def gather_evidence(self, question: str, category: str) -> Dict:
         """
@@ -216,8 +542,22 @@ class KalkiAgent:
         """
         source_functions = self.sources.get(category, self.sources['general'])
         
-        tasks = [func(question) for func in source_functions]
-        results = await asyncio.gather(*tasks, return_exceptions=True)
+        # One timestamp shared by every source in this round
+        ts = int(time.time())
+        
+        # Placeholder sources are plain functions and return immediately;
+        # only the coroutines from real I/O sources go through gather.
+        # Errors from either kind are kept in results and filtered below.
+        results = []
+        for func in source_functions:
+            try:
+                results.append(func(question, ts=ts))
+            except Exception as e:
+                results.append(e)
+        pending = [i for i, r in enumerate(results) if asyncio.iscoroutine(r)]
+        gathered = await asyncio.gather(*(results[i] for i in pending), return_exceptions=True)
+        for i, r in zip(pending, gathered):
+            results[i] = r
         
         # Filter out errors
         valid_results = [
@@ -229,7 +569,7 @@ class KalkiAgent:
             'category': category,
             'sources': valid_results,
             'source_count': len(valid_results),
-            'timestamp': int(datetime.now().timestamp())
+            'timestamp': ts
         }
     
     async def analyze_with_ai(self, question: str, evidence: Dict) -> Dict:
@@ -242,16 +582,53 @@ class KalkiAgent:
         # Simple heuristic for demo purposes
         # In production: Use OpenAI, Anthropic, or local LLM
         
-        # Example: Check if majority of sources agree
-        yes_count = sum(1 for s in evidence['sources'] if s.get('answer') == True)
-        no_count = sum(1 for s in evidence['sources'] if s.get('answer') == False)
+        # Example: Check which side the sources favour, each vote weighted
+        # by the source's own confidence
+        sources = evidence['sources']
+        n = len(sources)
         
-        if yes_count > no_count:
+        if n < VECTORIZE_THRESHOLD:
+            # Single pass in plain Python - cheaper than building arrays
+            yes_count = no_count = total = 0
+            yes_weight = no_weight = total_weight = 0.0
+            for s in sources:
+                a = s.get('answer')
+                w = _source_weight(s)
+                total += 1
+                total_weight += w
+                if a is True:
+                    yes_count += 1
+                    yes_weight += w
+                elif a is False:
+                    no_count += 1
+                    no_weight += w
+            score = yes_weight - no_weight
+        else:
+            answers = np.fromiter(
+                (_encode_answer(s.get('answer')) for s in sources),
+                dtype=np.int8,
+                count=n
+            )
+            weights = np.fromiter(
+                (_source_weight(s) for s in sources),
+                dtype=np.float32,
+                count=n
+            )
+            yes_count, no_count, total = _score(answers)
+            score = float(np.dot(answers.astype(np.float32), weights))
+            yes_weight = float(weights[answers == 1].sum())
+            no_weight = yes_weight - score
+            total_weight = float(weights.sum())
+        
+        # Confidence is the winning side's share of the weight of *all* sources,
+        # so sources without an answer still pull it down; with equal weights
+        # this is exactly the unweighted count / total share
+        if score > 0:
             outcome = True
-            confidence = min(95, 60 + (yes_count / len(evidence['sources']) * 40))
-        elif no_count > yes_count:
+            confidence = min(95, 60 + 40 * yes_weight / total_weight)
+        elif score < 0:
             outcome = False
-            confidence = min(95, 60 + (no_count / len(evidence['sources']) * 40))
+            confidence = min(95, 60 + 40 * no_weight / total_weight)
         else:
             # Uncertain - default to conservative approach
             outcome = False
@@ -260,59 +637,60 @@ class KalkiAgent:
         return {
             'outcome': outcome,
             'confidence': int(confidence),
-            'reasoning': f"Based on {len(evidence['sources'])} sources: {yes_count} YES, {no_count} NO",
+            'reasoning': (
+                f"Based on {total} sources, votes weighted by source confidence: "
+                f"{yes_count} YES (weight {yes_weight:g}), {no_count} NO (weight {no_weight:g})"
+            ),
             'key_evidence': evidence['sources'][0] if evidence['sources'] else {}
         }
     
-    async def query_coingecko(self, question: str) -> Dict:
+    async def query_coingecko(self, question: str, ts: Optional[int] = None) -> Dict:
         """
         Query CoinGecko API for crypto prices
         """
         try:
-            async with aiohttp.ClientSession() as session:
-                url = "https://api.coingecko.com/api/v3/simple/price"
-                params = {
-                    "ids": "bitcoin,ethereum,binancecoin",
-                    "vs_currencies": "usd"
-                }
-                
-                async with session.get(url, params=params) as resp:
-                    data = await resp.json()
-                    
-                    return {
-                        'source': 'CoinGecko',
-                        'data': data,
-                        'answer': None,  # Parse based on question
-                        'timestamp': int(datetime.now().timestamp())
-                    }
+            url = "https://api.coingecko.com/api/v3/simple/price"
+            params = {
+                "ids": "bitcoin,ethereum,binancecoin",
+                "vs_currencies": "usd"
+            }
+            
+            resp = await self.http.get(url, params=params)
+            data = orjson.loads(resp.content)
+            
+            return {
+                'source': 'CoinGecko',
+                'data': data,
+                'answer': None,  # Parse based on question
+                'timestamp': ts or int(time.time())
+            }
         except Exception as e:
             logger.error(f"Error querying CoinGecko: {e}")
             raise
     
-    async def query_binance(self, question: str) -> Dict:
+    async def query_binance(self, question: str, ts: Optional[int] = None) -> Dict:
         """
         Query Binance API for crypto prices
         """
         try:
-            async with aiohttp.ClientSession() as session:
-                url = "https://api.binance.com/api/v3/ticker/price"
-                params = {"symbol": "BTCUSDT"}
-                
-                async with session.get(url, params=params) as resp:
-                    data = await resp.json()
-                    price = float(data['price'])
-                    
-                    return {
-                        'source': 'Binance',
-                        'data': {'btc_price': price},
-                        'answer': None,
-                        'timestamp': int(datetime.now().timestamp())
-                    }
+            url = "https://api.binance.com/api/v3/ticker/price"
+            params = {"symbol": "BTCUSDT"}
+            
+            resp = await self.http.get(url, params=params)
+            data = orjson.loads(resp.content)
+            price = float(data['price'])
+            
+            return {
+                'source': 'Binance',
+                'data': {'btc_price': price},
+                'answer': None,
+                'timestamp': ts or int(time.time())
+            }
         except Exception as e:
             logger.error(f"Error querying Binance: {e}")
             raise
     
-    async def query_coinmarketcap(self, question: str) -> Dict:
+    def query_coinmarketcap(self, question: str, ts: Optional[int] = None) -> Dict:
         """
         Query CoinMarketCap (placeholder)
         """
@@ -320,10 +698,10 @@ class KalkiAgent:
             'source': 'CoinMarketCap',
             'data': {},
             'answer': None,
-            'timestamp': int(datetime.now().timestamp())
+            'timestamp': ts or int(time.time())
         }
     
-    async def query_espn(self, question: str) -> Dict:
+    def query_espn(self, question: str, ts: Optional[int] = None) -> Dict:
         """
         Query ESPN (placeholder)
         """
@@ -331,10 +709,10 @@ class KalkiAgent:
             'source': 'ESPN',
             'data': {},
             'answer': None,
-            'timestamp': int(datetime.now().timestamp())
+            'timestamp': ts or int(time.time())
         }
     
-    async def query_thescore(self, question: str) -> Dict:
+    def query_thescore(self, question: str, ts: Optional[int] = None) -> Dict:
         """
         Query TheScore (placeholder)
         """
@@ -342,10 +720,10 @@ class KalkiAgent:
             'source': 'TheScore',
             'data': {},
             'answer': None,
-            'timestamp': int(datetime.now().timestamp())
+            'timestamp': ts or int(time.time())
         }
     
-    async def query_perplexity(self, question: str) -> Dict:
+    async def query_perplexity(self, question: str, ts: Optional[int] = None) -> Dict:
         """
         Real-time web search using Perplexity AI
         """
@@ -375,22 +753,28 @@ class KalkiAgent:
                 "Content-Type": "application/json"
             }
             
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url, json=payload, headers=headers) as resp:
-                    data = await resp.json()
-                    answer_text = data['choices'][0]['message']['content'].lower()
-                    
-                    return {
-                        'source': 'Perplexity AI',
-                        'data': {'raw_answer': answer_text},
-                        'answer': 'yes' in answer_text,
-                        'timestamp': int(datetime.now().timestamp())
-                    }
+            resp = await self.http.post(url, content=orjson.dumps(payload), headers=headers)
+            raw = resp.content
+            
+            # Only the short answer is needed - avoid decoding the whole response
+            match = _SHORT_CONTENT_RE.search(raw)
+            if match:
+                answer_text = match.group(1).decode().lower()
+            else:
+                data = orjson.loads(raw)
+                answer_text = data['choices'][0]['message']['content'].lower()
+            
+            return {
+                'source': 'Perplexity AI',
+                'data': {'raw_answer': answer_text},
+                'answer': 'yes' in answer_text,
+                'timestamp': ts or int(time.time())
+            }
         except Exception as e:
             logger.error(f"Error querying Perplexity: {e}")
             raise
     
-    async def query_google_news(self, question: str) -> Dict:
+    def query_google_news(self, question: str, ts: Optional[int] = None) -> Dict:
         """
         Query Google News (placeholder)
         """
@@ -398,7 +782,7 @@ class KalkiAgent:
             'source': 'Google News',
             'data': {},
             'answer': None,
-            'timestamp': int(datetime.now().timestamp())
+            'timestamp': ts or int(time.time())
         }
     
     async def submit_resolution(
@@ -412,36 +796,120 @@ class KalkiAgent:
         Submit resolution to smart contract
         """
         # Upload evidence to IPFS (or use hash for demo)
-        evidence_hash = self.w3.keccak(text=json.dumps(evidence))
+        evidence_hash = _hash_evidence(evidence)
         
         # Build transaction
-        tx = self.contract.functions.submitResolution(
-            request_id,
-            outcome,
-            confidence,
-            evidence_hash
-        ).build_transaction({
+        data = SUBMIT_RESOLUTION_SELECTOR + encode(
+            SUBMIT_RESOLUTION_TYPES,
+            [request_id, outcome, confidence, evidence_hash]
+        )
+        tx = {
             'from': self.account.address,
-            'nonce': self.w3.eth.get_transaction_count(self.account.address),
+            'to': self.contract.address,
+            'value': 0,
+            'data': data,
             'gas': 300000,
-            'gasPrice': self.w3.eth.gas_price
-        })
+            'gasPrice': await self._cached_gas_price(),
+            'chainId': await self._cached_chain_id()
+        }
         
-        # Sign transaction
-        signed_tx = self.w3.eth.account.sign_transaction(tx, self.account.key)
+        # Sign, send and wait for confirmation
+        tx_hash = await self._sign_and_send(tx)
         
-        # Send transaction
-        tx_hash = self.w3.eth.send_raw_transaction(signed_tx.rawTransaction)
+        return tx_hash.hex()
+    
+    async def _cached_gas_price(self) -> int:
+        """Gas price, refreshed at most every GAS_PRICE_TTL seconds"""
+        price, fetched_at = self._gas_price_cache
+        if price and time.monotonic() - fetched_at < GAS_PRICE_TTL:
+            return price
         
-        # Wait for confirmation
-        receipt = self.w3.eth.wait_for_transaction_receipt(tx_hash)
+        price = await self.w3.eth.gas_price
+        self._gas_price_cache = (price, time.monotonic())
+        return price
+    
+    async def _cached_chain_id(self) -> int:
+        """Chain ID, fetched once"""
+        if self._chain_id is None:
+            self._chain_id = await self.w3.eth.chain_id
+        return self._chain_id
+    
+    async def _next_nonce(self) -> int:
+        """
+        Next nonce from a local counter, seeded from the chain on first use
+        and after a failed submission
+        """
+        async with self._nonce_lock:
+            if self._nonce is None:
+                self._nonce = await self.w3.eth.get_transaction_count(
+                    self.account.address, 'pending'
+                )
+            nonce = self._nonce
+            self._nonce += 1
+            return nonce
+    
+    async def _reset_nonce(self):
+        """Drop the local nonce counter so the next tx reseeds it from chain"""
+        async with self._nonce_lock:
+            self._nonce = None
+    
+    async def _sign_and_send(self, tx: Dict) -> bytes:
+        """
+        Assign the next nonce to a fully built tx, sign and broadcast it, and
+        wait for the receipt. If the nonce never makes it into a block, the
+        counter is resynced so later transactions are not queued behind a gap.
+        """
+        # Taken last, once nothing but signing and broadcasting can fail
+        nonce = await self._next_nonce()
         
-        return tx_hash.hex()
+        try:
+            # Sign transaction (CPU-bound ECDSA, kept off the event loop)
+            signed_tx = await asyncio.to_thread(
+                self.w3.eth.account.sign_transaction,
+                {**tx, 'nonce': nonce},
+                self.account.key
+            )
+            tx_hash = await self.w3.eth.send_raw_transaction(signed_tx.rawTransaction)
+        except Exception as e:
+            # Includes "nonce too low" / "already known" (counter drifted) as
+            # well as failures that left this nonce unused
+            logger.warning(f"Transaction not sent, resyncing nonce: {e}")
+            await self._reset_nonce()
+            raise
+        
+        try:
+            await self.wait_for_receipt(tx_hash)
+        except TimeoutError:
+            # A dropped tx leaves the same gap as one that was never sent
+            logger.warning(f"Transaction {tx_hash.hex()} not mined, resyncing nonce")
+            await self._reset_nonce()
+            raise
+        
+        return tx_hash
+    
+    async def wait_for_receipt(
+        self,
+        tx_hash: bytes,
+        timeout: float = 120,
+        poll_interval: float = 1
+    ) -> Dict:
+        """
+        Poll for a transaction receipt without blocking the event loop
+        """
+        deadline = asyncio.get_running_loop().time() + timeout
+        
+        while True:
+            try:
+                return await self.w3.eth.get_transaction_receipt(tx_hash)
+            except TransactionNotFound:
+                if asyncio.get_running_loop().time() >= deadline:
+                    raise TimeoutError(f"Transaction {tx_hash.hex()} not mined after {timeout}s")
+                await asyncio.sleep(poll_interval)
     
     async def get_agent_stats(self) -> Dict:
         """Get current agent statistics"""
         try:
-            stats = self.contract.functions.getAgentStats(self.account.address).call()
+            stats = await self._fn_get_agent_stats(self.account.address).call()
             
             return {
                 'stake': stats[0],
@@ -466,17 +934,15 @@ class KalkiAgent:
         
         stake_wei = self.w3.to_wei(stake_amount, 'ether')
         
-        tx = self.contract.functions.registerAgent().build_transaction({
+        tx = await self._fn_register_agent().build_transaction({
             'from': self.account.address,
             'value': stake_wei,
-            'nonce': self.w3.eth.get_transaction_count(self.account.address),
             'gas': 200000,
-            'gasPrice': self.w3.eth.gas_price
+            'gasPrice': await self._cached_gas_price(),
+            'chainId': await self._cached_chain_id()
         })
         
-        signed_tx = self.w3.eth.account.sign_transaction(tx, self.account.key)
-        tx_hash = self.w3.eth.send_raw_transaction(signed_tx.rawTransaction)
-        receipt = self.w3.eth.wait_for_transaction_receipt(tx_hash)
+        tx_hash = await self._sign_and_send(tx)
         
         logger.info(f"✅ Agent registered! TX: {tx_hash.hex()}")
         return tx_hash.hex()
@@ -493,6 +959,7 @@ async def main():
     PRIVATE_KEY = os.getenv('AGENT_PRIVATE_KEY')
     CONTRACT_ADDRESS = os.getenv('KALKI_CONTRACT_ADDRESS')
     RPC_URL = os.getenv('BNB_RPC_URL', 'https://data-seed-prebsc-1-s1.bnbchain.org:8545')
+    WS_RPC_URL = os.getenv('BNB_WS_URL')
     
     if not PRIVATE_KEY or not CONTRACT_ADDRESS:
         logger.error("❌ Please set AGENT_PRIVATE_KEY and KALKI_CONTRACT_ADDRESS in .env")
@@ -502,7 +969,8 @@ async def main():
     agent = KalkiAgent(
         private_key=PRIVATE_KEY,
         contract_address=CONTRACT_ADDRESS,
-        rpc_url=RPC_URL
+        rpc_url=RPC_URL,
+        ws_rpc_url=WS_RPC_URL
     )
     
     # Start listening for requests